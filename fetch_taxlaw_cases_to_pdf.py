@@ -8,7 +8,8 @@ Example:
     --out ./pdf_out \
     --start 200000000000014300 \
     --end   200000000000014350 \
-    --delay 0.5
+    --delay 0.5 \
+    --concurrency 8
 
 The script uses the same JSON APIs that the 웹사이트 employs:
   - ASIQTB002PR01 : 상세 데이터를 가져와 첨부파일 정보(dcmHwpEditorDVOList 포함)를 조회
@@ -19,36 +20,88 @@ If PDF 변환이 실패하면 해당 사건은 "skipped" 처리합니다.
 
 import argparse
 import json
+import os
 import sys
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
+from urllib.parse import quote
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 BASE = "https://taxlaw.nts.go.kr"
 ACTION_URL = BASE + "/action.do"
 DETAIL_ACTION = "ASIQTB002PR01"
 FILE_INFO_ACTION = "ACMCMA001MR02"
 PDF_DOWNLOAD_PATH = "/downloadPDFFile.do"
+CHUNK_SIZE = 64 * 1024
+LOG_FLUSH_EVERY = 64
+_FILENAME_TABLE = str.maketrans({c: "_" for c in '/\\:*?"<>|'})
+# Pre-encoded ASIQTB002PR01 form body; only the ID and group code vary per call.
+# The quoted JSON fragments have their %XX escapes doubled so the template can
+# be filled with bytes %-formatting.
+_DETAIL_TEMPLATE = (
+    f"actionId={DETAIL_ACTION}&paramData="
+    + "%s".join(
+        quote(part, safe="").replace("%", "%%")
+        for part in ('{"dcmDVO":{"ntstDcmId":"', '","ntstDcmGrpCd":"', '"}}')
+    )
+).encode()
+_FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
 USER_AGENT = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
     "(KHTML, like Gecko) Chrome/117.0 Safari/537.36"
 )
 
 
+class RateLimiter:
+    # Token bucket: allows bursts of up to `burst` cases while holding the
+    # long-run average at `rate` cases per second across all workers.
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
 def build_session() -> requests.Session:
     session = requests.Session()
     session.headers.update({"User-Agent": USER_AGENT})
+    # Reuse keep-alive connections across the sweep and retry transient 5xx.
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=["GET", "POST"],
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=64, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
     return session
 
 
 def sanitize_filename(text: str, max_len: int = 180) -> str:
-    text = text or "판례"
-    text = text.replace("/", "_").replace("\\", "_").replace(":", "_")
-    text = text.replace("*", "_").replace("?", "_").replace("\"", "_")
-    text = text.replace("<", "_").replace(">", "_").replace("|", "_")
+    text = (text or "판례").translate(_FILENAME_TABLE)
     text = " ".join(text.split())
     return text[:max_len] or "판례"
 
@@ -59,6 +112,10 @@ def request_action(session: requests.Session, action_id: str, payload: dict) ->
         "paramData": json.dumps(payload, ensure_ascii=False),
     }
     resp = session.post(ACTION_URL, data=data, timeout=15)
+    return parse_action_response(action_id, resp)
+
+
+def parse_action_response(action_id: str, resp: requests.Response) -> dict:
     resp.raise_for_status()
     result = resp.json()
     if result.get("status") != "SUCCESS":
@@ -67,10 +124,12 @@ def request_action(session: requests.Session, action_id: str, payload: dict) ->
 
 
 def fetch_detail(session: requests.Session, ntst_id: str, group_code: Optional[str]) -> Optional[dict]:
-    dcm_dvo = {"ntstDcmId": ntst_id}
     if group_code:
-        dcm_dvo["ntstDcmGrpCd"] = group_code
-    data = request_action(session, DETAIL_ACTION, {"dcmDVO": dcm_dvo})
+        body = _DETAIL_TEMPLATE % (quote(ntst_id, safe="").encode(), quote(group_code, safe="").encode())
+        resp = session.post(ACTION_URL, data=body, headers=_FORM_HEADERS, timeout=15)
+        data = parse_action_response(DETAIL_ACTION, resp)
+    else:
+        data = request_action(session, DETAIL_ACTION, {"dcmDVO": {"ntstDcmId": ntst_id}})
     return data.get(DETAIL_ACTION)
 
 
@@ -83,34 +142,58 @@ def fetch_file_info(session: requests.Session, fle_id: str, fle_sn: int) -> Opti
     return items[0]
 
 
-def download_pdf(session: requests.Session, fle_id: str, fle_sn: int, out_path: Path, min_kb: int) -> bool:
-    params = {"fleId": fle_id, "fleSn": str(fle_sn)}
-    resp = session.get(BASE + PDF_DOWNLOAD_PATH, params=params, timeout=20)
+def write_pdf_stream(resp: requests.Response, out_path: Path, min_kb: int) -> bool:
     if resp.status_code != 200:
         return False
-    data = resp.content
-    if not data.startswith(b"%PDF") or len(data) < min_kb * 1024:
+    chunks = resp.iter_content(CHUNK_SIZE)
+    first = next(chunks, b"")
+    if not first.startswith(b"%PDF"):
+        return False
+    tmp_path = out_path.with_suffix(".part")
+    size = 0
+    try:
+        with tmp_path.open("wb") as fh:
+            fh.write(first)
+            size += len(first)
+            for chunk in chunks:
+                fh.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    if size < min_kb * 1024:
+        tmp_path.unlink(missing_ok=True)
         return False
-    out_path.write_bytes(data)
+    os.replace(tmp_path, out_path)
     return True
 
 
+def download_pdf(session: requests.Session, fle_id: str, fle_sn: int, out_path: Path, min_kb: int) -> bool:
+    params = {"fleId": fle_id, "fleSn": str(fle_sn)}
+    with session.get(BASE + PDF_DOWNLOAD_PATH, params=params, timeout=20, stream=True) as resp:
+        return write_pdf_stream(resp, out_path, min_kb)
+
+
 def resolve_filename(ntst_id: str, detail: dict) -> str:
     dvo = detail.get("dcmDVO", {}) if detail else {}
+    # Sanitize each server-supplied field once instead of re-scanning the joined name.
     title = sanitize_filename(dvo.get("ntstDcmTtl", ""))
     date = dvo.get("ntstDcmRgtDt") or ""
     case_no = dvo.get("ntstPrdgHpnnNoCntn") or ""
+    if case_no:
+        case_no = sanitize_filename(case_no)
     parts = [part for part in [date, case_no, title, ntst_id] if part]
-    return sanitize_filename("_".join(parts)) or ntst_id
+    return "_".join(parts)[:180] or ntst_id
+
+
+def done_marker(out_dir: Path, ntst_id: int) -> Path:
+    # Output filenames depend on the detail payload, so completion is tracked per ID.
+    return out_dir / f".done_{ntst_id}"
 
 
 def fetch_case(session: requests.Session, ntst_id: int, out_dir: Path, min_kb: int, group_code: Optional[str]) -> bool:
     ntst_str = str(ntst_id)
-    try:
-        detail = fetch_detail(session, ntst_str, group_code)
-    except Exception as exc:
-        print(f"    detail fetch error: {exc}", file=sys.stderr)
-        return False
+    detail = fetch_detail(session, ntst_str, group_code)
     if not detail:
         return False
 
@@ -132,6 +215,7 @@ def fetch_case(session: requests.Session, ntst_id: int, out_dir: Path, min_kb: i
     out_path = out_dir / filename
 
     if download_pdf(session, fle_id, fle_sn, out_path, min_kb):
+        done_marker(out_dir, ntst_id).touch()
         return True
 
     # Fallback attempt via file info (may provide download URI)
@@ -139,14 +223,18 @@ def fetch_case(session: requests.Session, ntst_id: int, out_dir: Path, min_kb: i
         info = fetch_file_info(session, fle_id, fle_sn)
         if info and info.get("fleDwldUri"):
             alt_url = requests.compat.urljoin(BASE, info["fleDwldUri"])
-            resp = session.get(alt_url, timeout=20)
-            if resp.status_code == 200 and resp.content.startswith(b"%PDF") and len(resp.content) >= min_kb * 1024:
-                out_path.write_bytes(resp.content)
-                return True
+            with session.get(alt_url, timeout=20, stream=True) as resp:
+                if write_pdf_stream(resp, out_path, min_kb):
+                    done_marker(out_dir, ntst_id).touch()
+                    return True
     except Exception as exc:
-        print(f"    fallback download error: {exc}", file=sys.stderr)
+        # Raised rather than printed: fetch_case runs on a worker thread, and
+        # main logs the error next to this case's own progress line.
+        raise RuntimeError(f"fallback download error: {exc}") from exc
 
-    return False
+    # The case has an attachment, so a failed download (throttling, 5xx, a
+    # short PDF) is an error rather than a known-empty ID.
+    raise RuntimeError("PDF download failed")
 
 
 def main() -> None:
@@ -154,9 +242,20 @@ def main() -> None:
     parser.add_argument("--out", required=True, help="Output directory")
     parser.add_argument("--start", type=int, required=True, help="Start ntstDcmId (inclusive)")
     parser.add_argument("--end", type=int, required=True, help="End ntstDcmId (inclusive)")
-    parser.add_argument("--delay", type=float, default=0.5, help="Delay between requests (seconds)")
+    parser.add_argument("--delay", type=float, default=0.5, help="Average delay between cases across all workers (seconds)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of cases fetched in parallel (default: 8)")
     parser.add_argument("--min-kb", type=int, default=10, help="Minimum PDF size in KB")
     parser.add_argument("--group", default="01", help="ntstDcmGrpCd (default: 01)")
+    parser.add_argument(
+        "--skip-cache",
+        default=None,
+        help="File of ntstDcmIds known to have no PDF; they are skipped on later runs (default: <out>/.skipped.<group>.ids)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip IDs already downloaded by a previous run (tracked via .done_<id> markers in --out)",
+    )
     parser.add_argument(
         "--log",
         default=None,
@@ -172,6 +271,9 @@ def main() -> None:
     if args.start > args.end:
         print("start must be <= end", file=sys.stderr)
         raise SystemExit(1)
+    if args.concurrency < 1:
+        print("concurrency must be >= 1", file=sys.stderr)
+        raise SystemExit(1)
 
     out_dir = Path(args.out)
     out_dir.mkdir(parents=True, exist_ok=True)
@@ -183,37 +285,89 @@ def main() -> None:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
         log_path = Path(args.log_dir) / f"{timestamp}.log"
     log_path.parent.mkdir(parents=True, exist_ok=True)
-    log_file = log_path.open("a", encoding="utf-8")
+    log_file = log_path.open("a", encoding="utf-8", buffering=8192)
     log_file.write(f"# Command: {' '.join(map(str, sys.argv))}\n")
     log_file.flush()
+    log_lines = 0
 
     def log(message: str, *, err: bool = False) -> None:
-        print(message, file=sys.stderr if err else sys.stdout, flush=True)
+        # Flush in batches; a crash loses at most the last few lines.
+        nonlocal log_lines
+        print(message, file=sys.stderr if err else sys.stdout)
         if log_file:
             log_file.write(message + "\n")
-            log_file.flush()
-
-    session = build_session()
-    total = args.end - args.start + 1
-    saved = skipped = 0
-
-    for idx, ntst_id in enumerate(range(args.start, args.end + 1), start=1):
-        success = False
-        try:
-            success = fetch_case(session, ntst_id, out_dir, args.min_kb, args.group)
-        except Exception as exc:
-            log(f"[{idx}/{total}] {ntst_id} error: {exc}", err=True)
-        if success:
-            saved += 1
-            log(f"[{idx}/{total}] {ntst_id} saved")
-        else:
-            skipped += 1
-            log(f"[{idx}/{total}] {ntst_id} skipped")
-        time.sleep(args.delay)
-
-    log(f"[DONE] saved={saved}, skipped={skipped}, total={total}")
-
-    log_file.close()
+            log_lines += 1
+            if log_lines % LOG_FLUSH_EVERY == 0:
+                log_file.flush()
+
+    # Emptiness depends on ntstDcmGrpCd, so the default file is kept per group.
+    skip_path = Path(args.skip_cache) if args.skip_cache else out_dir / f".skipped.{args.group or 'none'}.ids"
+    skip_path.parent.mkdir(parents=True, exist_ok=True)
+    known_empty: frozenset = frozenset()
+    if skip_path.exists():
+        with skip_path.open(encoding="utf-8") as fh:
+            known_empty = frozenset(int(line) for line in fh if line.strip())
+    skip_file = skip_path.open("a", encoding="utf-8", buffering=1)
+
+    try:
+        session = build_session()
+        total = args.end - args.start + 1
+        cached = sum(1 for ntst_id in known_empty if args.start <= ntst_id <= args.end)
+        todo = total - cached
+        saved = skipped = resumed = 0
+
+        limiter = RateLimiter(1.0 / args.delay, args.concurrency) if args.delay > 0 else None
+
+        def worker(ntst_id: int) -> Optional[bool]:
+            # None marks an ID already downloaded by an earlier run.
+            if args.resume and done_marker(out_dir, ntst_id).exists():
+                return None
+            if limiter:
+                limiter.acquire()
+            return fetch_case(session, ntst_id, out_dir, args.min_kb, args.group)
+
+        # Submit a bounded window of cases and consume results in ID order so the
+        # log stays sequential while several requests are in flight.
+        ids = (ntst_id for ntst_id in range(args.start, args.end + 1) if ntst_id not in known_empty)
+        pending: deque = deque()
+        window = args.concurrency * 2
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            for ntst_id in ids:
+                pending.append((ntst_id, executor.submit(worker, ntst_id)))
+                if len(pending) >= window:
+                    break
+            idx = 0
+            while pending:
+                ntst_id, future = pending.popleft()
+                next_id = next(ids, None)
+                if next_id is not None:
+                    pending.append((next_id, executor.submit(worker, next_id)))
+                idx += 1
+                result: Optional[bool] = False
+                failed = False
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    failed = True
+                    log(f"[{idx}/{todo}] {ntst_id} error: {exc}", err=True)
+                if result is None:
+                    resumed += 1
+                    log(f"[{idx}/{todo}] {ntst_id} resumed")
+                elif result:
+                    saved += 1
+                    log(f"[{idx}/{todo}] {ntst_id} saved")
+                else:
+                    skipped += 1
+                    log(f"[{idx}/{todo}] {ntst_id} skipped")
+                    # fetch_case returns False only for IDs with no detail or no
+                    # hwp/pdf attachment; download failures raise and are retried.
+                    if not failed:
+                        skip_file.write(f"{ntst_id}\n")
+
+        log(f"[DONE] saved={saved}, skipped={skipped}, cached={cached}, resumed={resumed}, total={total}")
+    finally:
+        skip_file.close()
+        log_file.close()
 
 
 if __name__ == "__main__":
@@ -16,17 +16,34 @@ Environment:
 from __future__ import annotations
 
 import argparse
+import hashlib
+import io
+import json
 import os
 import re
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
 from pathlib import Path
-from textwrap import dedent
-from typing import Iterable, List, Sequence, Tuple
+from typing import Dict, Iterable, List, Sequence, Tuple
 
-import requests
-from pypdf import PdfReader
+import httpx
+import pymupdf
 
 EMBED_MODEL = "text-embedding-3-small"
 DIM = 1536
+EMBED_BATCH_SIZE = 96
+EMBED_WORKERS = 8
+
+_BLOCK_SPLIT = re.compile(r"\n\s*\n")
+_WS = re.compile(r"\s+")
+_SECNUM = re.compile(r"^[0-9IVX]+\.")
+_VECTOR_FMT = ", ".join(["%.8f"] * DIM)
+
+OPENAI_EMBEDDINGS_URL = "https://api.openai.com/v1/embeddings"
+EMBED_RETRIES = 5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 
 def parse_args() -> argparse.Namespace:
@@ -38,22 +55,27 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--max-chars", type=int, default=1100, help="Maximum characters per chunk.")
     parser.add_argument("--min-chars", type=int, default=200, help="Minimum characters per chunk.")
     parser.add_argument("--max-chunks", type=int, default=120, help="Maximum chunks to generate.")
+    parser.add_argument(
+        "--cache",
+        default=None,
+        help="Optional JSONL file caching embeddings by chunk hash (e.g. .embed_cache.jsonl).",
+    )
     return parser.parse_args()
 
 
 def extract_paragraphs(pdf_path: Path) -> List[str]:
-    reader = PdfReader(str(pdf_path))
     paragraphs: List[str] = []
-    for page in reader.pages:
-        text = page.extract_text() or ""
+    with pymupdf.open(str(pdf_path)) as document:
+        pages = [page.get_text("text") for page in document]
+    for text in pages:
         text = text.replace("\u00a0", " ")
-        blocks = re.split(r"\n\s*\n", text)
+        blocks = _BLOCK_SPLIT.split(text)
         for block in blocks:
             normalized = " ".join(line.strip() for line in block.splitlines())
-            normalized = re.sub(r"\s+", " ", normalized).strip()
+            normalized = _WS.sub(" ", normalized).strip()
             if not normalized:
                 continue
-            if len(normalized) < 25 and not re.match(r"^[0-9IVX]+\.", normalized):
+            if len(normalized) < 25 and not _SECNUM.match(normalized):
                 # Skip tiny headings unless they look like section markers.
                 continue
             paragraphs.append(normalized)
@@ -66,49 +88,87 @@ def chunk_paragraphs(
     min_chars: int,
     max_chunks: int,
 ) -> List[str]:
+    # offsets[i] is the joined length (plus separators) of paragraphs[:i], so
+    # each chunk boundary is a single bisect instead of a per-paragraph append.
+    offsets = list(accumulate((len(paragraph) + 1 for paragraph in paragraphs), initial=0))
     chunks: List[str] = []
-    buffer: List[str] = []
-    buffer_len = 0
-    for paragraph in paragraphs:
-        if buffer and buffer_len + len(paragraph) + 1 > max_chars:
-            chunk = " ".join(buffer).strip()
-            if len(chunk) >= min_chars:
-                chunks.append(chunk)
-            buffer = []
-            buffer_len = 0
-            if len(chunks) >= max_chunks:
-                break
-        buffer.append(paragraph)
-        buffer_len += len(paragraph) + 1
-    if buffer and len(chunks) < max_chunks:
-        chunk = " ".join(buffer).strip()
+    start = 0
+    while start < len(paragraphs) and len(chunks) < max_chunks:
+        end = max(bisect_right(offsets, offsets[start] + max_chars) - 1, start + 1)
+        chunk = " ".join(paragraphs[start:end]).strip()
         if len(chunk) >= min_chars:
             chunks.append(chunk)
-    return chunks[:max_chunks]
-
-
-def fetch_embedding(text: str, api_key: str) -> List[float]:
-    response = requests.post(
-        "https://api.openai.com/v1/embeddings",
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-        json={
-            "input": text,
-            "model": EMBED_MODEL,
-        },
-        timeout=60,
+        start = end
+    return chunks
+
+
+def build_client(api_key: str) -> httpx.Client:
+    # HTTP/2 multiplexes every embedding request over a single TLS connection.
+    return httpx.Client(
+        timeout=60.0,
+        headers={"Authorization": f"Bearer {api_key}"},
+        transport=httpx.HTTPTransport(http2=True, retries=3),
     )
+
+
+def retry_delay(response: httpx.Response, attempt: int) -> float:
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+    return float(2 ** attempt)
+
+
+def fetch_embeddings(texts: Sequence[str], client: httpx.Client) -> List[List[float]]:
+    for attempt in range(EMBED_RETRIES + 1):
+        response = client.post(
+            OPENAI_EMBEDDINGS_URL,
+            json={
+                "input": list(texts),
+                "model": EMBED_MODEL,
+            },
+        )
+        if response.status_code not in RETRY_STATUSES or attempt == EMBED_RETRIES:
+            break
+        time.sleep(retry_delay(response, attempt))
     if response.status_code != 200:
         raise RuntimeError(
             f"OpenAI embeddings failed {response.status_code}: {response.text}",
         )
     payload = response.json()
-    embedding = payload["data"][0]["embedding"]
-    if len(embedding) != DIM:
-        raise ValueError(f"Expected embedding dim {DIM}, got {len(embedding)}")
-    return embedding
+    rows = sorted(payload["data"], key=lambda row: row["index"])
+    if len(rows) != len(texts):
+        raise ValueError(f"Expected {len(texts)} embeddings, got {len(rows)}")
+    embeddings = [row["embedding"] for row in rows]
+    for embedding in embeddings:
+        if len(embedding) != DIM:
+            raise ValueError(f"Expected embedding dim {DIM}, got {len(embedding)}")
+    return embeddings
+
+
+def embedding_key(text: str) -> str:
+    # The model name is part of the key so switching models never reuses stale vectors.
+    return hashlib.blake2b(f"{EMBED_MODEL}\n{text}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def load_embedding_cache(path: Path) -> Dict[str, List[float]]:
+    cache: Dict[str, List[float]] = {}
+    if not path.exists():
+        return cache
+    with path.open(encoding="utf-8") as fh:
+        for line in fh:
+            # Skip lines truncated by an interrupted append and vectors of the
+            # wrong size; those chunks are simply embedded again.
+            try:
+                row = json.loads(line)
+                key, embedding = row["h"], row["e"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if isinstance(embedding, list) and len(embedding) == DIM:
+                cache[key] = embedding
+    return cache
 
 
 def sql_escape(value: str) -> str:
@@ -116,35 +176,33 @@ def sql_escape(value: str) -> str:
 
 
 def format_vector(values: Sequence[float]) -> str:
-    return "[" + ", ".join(f"{v:.8f}" for v in values) + "]"
+    # One C-level format call for the whole vector; expects exactly DIM values.
+    return "[" + (_VECTOR_FMT % tuple(values)) + "]"
 
 
 def build_sql(title: str, source: str, chunks: Sequence[Tuple[str, Sequence[float]]]) -> str:
-    value_rows = []
+    # Rows are streamed into one buffer rather than collected, joined and dedented.
+    buf = io.StringIO()
+    buf.write(
+        f"-- Seed generated with OpenAI embeddings from {sql_escape(source)}\n"
+        "truncate table insurance_chunks restart identity cascade;\n"
+        "truncate table insurance_docs restart identity cascade;\n"
+        "\n"
+        "with doc as (\n"
+        "  insert into insurance_docs (title, source)\n"
+        f"  values ('{sql_escape(title)}', '{sql_escape(source)}')\n"
+        "  returning id\n"
+        ")\n"
+        "insert into insurance_chunks (doc_id, chunk_index, content, embedding)\n"
+        "select doc.id, payload.chunk_index, payload.content, payload.embedding\n"
+        "from doc,\n"
+        "lateral (values",
+    )
     for index, (content, embedding) in enumerate(chunks):
-        value_rows.append(
-            f"({index}, '{sql_escape(content)}', '{format_vector(embedding)}'::vector({DIM}))",
-        )
-    values_sql = ",\n      ".join(value_rows)
-    return dedent(
-        f"""
-        -- Seed generated with OpenAI embeddings from {sql_escape(source)}
-        truncate table insurance_chunks restart identity cascade;
-        truncate table insurance_docs restart identity cascade;
-
-        with doc as (
-          insert into insurance_docs (title, source)
-          values ('{sql_escape(title)}', '{sql_escape(source)}')
-          returning id
-        )
-        insert into insurance_chunks (doc_id, chunk_index, content, embedding)
-        select doc.id, payload.chunk_index, payload.content, payload.embedding
-        from doc,
-        lateral (values
-          {values_sql}
-        ) as payload(chunk_index, content, embedding);
-        """,
-    ).strip() + "\n"
+        buf.write("," if index else "")
+        buf.write(f"\n  ({index}, '{sql_escape(content)}', '{format_vector(embedding)}'::vector({DIM}))")
+    buf.write("\n) as payload(chunk_index, content, embedding);\n")
+    return buf.getvalue()
 
 
 def main() -> None:
@@ -165,11 +223,30 @@ def main() -> None:
     if not chunks:
         raise SystemExit("Chunking produced no output.")
 
-    dataset: List[Tuple[str, List[float]]] = []
-    for idx, chunk in enumerate(chunks):
-        print(f"Embedding chunk {idx + 1}/{len(chunks)} (len={len(chunk)})...")
-        embedding = fetch_embedding(chunk, api_key)
-        dataset.append((chunk, embedding))
+    cache_path = Path(args.cache) if args.cache else None
+    cache = load_embedding_cache(cache_path) if cache_path else {}
+    keys = [embedding_key(chunk) for chunk in chunks]
+    # Only embed chunks not already cached, each distinct text once.
+    misses = list({key: chunk for key, chunk in zip(keys, chunks) if key not in cache}.items())
+    batches = [misses[start:start + EMBED_BATCH_SIZE] for start in range(0, len(misses), EMBED_BATCH_SIZE)]
+    print(f"Embedding {len(misses)}/{len(chunks)} uncached chunks in {len(batches)} request(s)...")
+    cache_file = cache_path.open("a", encoding="utf-8", buffering=1) if cache_path and misses else None
+    client = build_client(api_key)
+    try:
+        with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as executor:
+            # map() keeps results in submission order.
+            results = executor.map(lambda batch: fetch_embeddings([chunk for _, chunk in batch], client), batches)
+            for batch, batch_embeddings in zip(batches, results):
+                for (key, _), embedding in zip(batch, batch_embeddings):
+                    cache[key] = embedding
+                    if cache_file:
+                        cache_file.write(json.dumps({"h": key, "e": embedding}) + "\n")
+    finally:
+        client.close()
+        if cache_file:
+            cache_file.close()
+    embeddings = [cache[key] for key in keys]
+    dataset: List[Tuple[str, List[float]]] = list(zip(chunks, embeddings))
 
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)